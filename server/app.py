@@ -1,19 +1,34 @@
 from __future__ import annotations
 
+import asyncio
+import codecs
+import hashlib
 import ipaddress
+import multiprocessing
 import os
+import re
 import socket
-from typing import List
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from typing import Callable, List
 from urllib.parse import urljoin, urlparse
 from urllib import robotparser
 
-import requests
-from bs4 import BeautifulSoup
+import aiohttp
+import orjson
+import tiktoken
+from aiohttp.resolver import DefaultResolver
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from openai import OpenAI
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, Response
+from openai import AsyncOpenAI
 from pydantic import BaseModel, HttpUrl
+from selectolax.lexbor import LexborHTMLParser
 
 # Load environment variables
 try:
@@ -26,7 +41,7 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 openai_client = None
 if OPENAI_API_KEY:
     try:
-        openai_client = OpenAI(api_key=OPENAI_API_KEY)
+        openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
         print("OpenAI client initialized successfully")
     except Exception as e:
         print(f"Warning: Could not initialize OpenAI client: {e}")
@@ -40,13 +55,107 @@ USER_AGENT = (
     "Scrape/1.0 (+https://example.com/contact) "
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"
 )
+FETCH_TIMEOUT = aiohttp.ClientTimeout(total=20, connect=5)
+HTTP_POOL_SIZE = 64  # keep-alive connections shared across requests
+EXTRACTION_WORKERS = os.cpu_count() or 1  # processes parsing pages in parallel
+EXTRACTION_POOL_MIN_BYTES = 500_000  # smaller pages parse as fast or faster in a thread
 MAX_DOWNLOAD_BYTES = 1_000_000  # ~1MB cap to avoid heavy downloads
-SCRAPABLE_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
 BLOCKED_HOSTS = {"localhost", "127.0.0.1", "0.0.0.0"}
+DNS_CACHE_TTL = 15 * 60  # seconds
+DNS_CACHE_SIZE = 4096
+ROBOTS_CACHE_TTL = 6 * 3600  # seconds
+ROBOTS_FAILURE_TTL = 5 * 60  # seconds
+ROBOTS_CACHE_SIZE = 1024
+ROBOTS_DECISION_CACHE_SIZE = 4096
+# Pages below these thresholds are not worth a paid analysis call.
+AI_MIN_WORDS = 30
+AI_SAMPLE_CHARS = 2048
+AI_MIN_PRINTABLE_RATIO = 0.8
+HEADING_LEVELS = ("h1", "h2", "h3", "h4", "h5", "h6")
+HEADING_SELECTOR = ", ".join(HEADING_LEVELS)
+AI_MODEL = "gpt-4o-mini"  # supports JSON mode
+AI_BATCH_MAX = 8  # pages per OpenAI call
+AI_BATCH_WAIT = 0.05  # seconds a batch stays open for more pages
+AI_MAX_CONCURRENT_CALLS = 4  # OpenAI requests in flight at once
+AI_MAX_TOKENS_PER_PAGE = 800  # output budget per page, pooled across a batch
+AI_MAX_INPUT_TOKENS = 3000  # page text sent per page
+AI_MAX_INPUT_CHARS = 12000  # fallback cap when the tokenizer is unavailable
+RESPONSE_CACHE_TTL = 10 * 60  # seconds a finished scrape is reused
+RESPONSE_CACHE_FAILURE_TTL = 30  # seconds, when the AI analysis came back empty
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024  # serialized bodies held at once
+AI_CACHE_TTL = 24 * 3600  # seconds
+AI_CACHE_SIZE = 4096
+AI_TIMEOUT = 20.0  # seconds for a single page, plus AI_TIMEOUT_PER_EXTRA_PAGE
+AI_TIMEOUT_PER_EXTRA_PAGE = 10.0
+# Built once; filled in per batch with str.format (literal braces in the JSON
+# example are doubled for that reason).
+AI_PROMPT_TEMPLATE = """Analyze each of the following {count} webpages comprehensively and provide detailed insights.
+
+{documents}
+
+For every page provide:
+1. summary: A comprehensive 3-4 sentence summary
+2. key_points: 5-7 main topics or key points
+3. category: Primary content type (e.g., "News Article", "Product Page", "Blog Post", "Documentation", "E-commerce", "Landing Page", etc.)
+4. sentiment: Overall sentiment (Positive, Negative, Neutral, or Mixed)
+5. entities: Important entities (people, organizations, locations, products)
+6. topics: 5-7 main topics discussed
+7. keywords: 10-15 important keywords
+8. structured_data: Structured information with keys like: purpose, target_audience, main_offer, contact_info, pricing_info, features (if applicable)
+9. insights: 2-3 actionable insights about the content
+
+Respond with a JSON object with exactly one entry per page, in this shape:
+{{"results": [{{"id": 1, "summary": "...", "key_points": ["..."], "category": "...", "sentiment": "...", "entities": [{{"name": "...", "type": "PERSON|ORG|LOCATION|PRODUCT"}}], "topics": ["..."], "keywords": ["..."], "structured_data": {{"purpose": "..."}}, "insights": "..."}}]}}"""
+AI_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": "You are an expert web content analyst that extracts comprehensive structured data and insights from web pages. Always respond with valid JSON.",
+}
+AI_DOCUMENT_TEMPLATE = """[DOC {id}]
+Title: {title}
+Content: {text}
+Additional Info: {tables_info}, {forms_info}, {links_count} links found
+[/DOC {id}]"""
+# Document markers inside page text or titles, which could otherwise close one
+# page and forge another in a shared batch prompt.
+DOC_MARKER_RE = re.compile(r"\[(\s*/?\s*DOC)", re.IGNORECASE)
+# Fragment-only and non-HTTP hrefs never resolve to a page we report
+SKIPPED_HREF_PREFIXES = ("#", "javascript:", "mailto:", "tel:")
+NON_TEXT_TAGS = ("script", "style", "noscript", "iframe")
+# charset from <meta charset="..."> or <meta http-equiv="Content-Type" content="...; charset=...">
+META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?([A-Za-z0-9_.:-]+)""", re.IGNORECASE)
+
+# Resolved IPv4 address per hostname, with the monotonic time it expires at.
+_dns_cache: OrderedDict[str, tuple[str, float]] = OrderedDict()
+# aiohttp's AsyncResolver (c-ares via aiodns) when available, else threaded.
+_resolver: DefaultResolver | None = None
+# Parsed robots.txt per scheme://host, with the monotonic time it expires at.
+_robots_cache: OrderedDict[str, tuple[robotparser.RobotFileParser | None, float]] = OrderedDict()
+# In-flight robots.txt download per scheme://host, shared by concurrent misses.
+_robots_downloads: dict[str, asyncio.Task] = {}
+# can_fetch() result per URL, with the expiry of the robots.txt it used.
+_robots_decisions: OrderedDict[str, tuple[bool, float]] = OrderedDict()
+# (prompt fields, future) per page waiting for the OpenAI batcher, and the
+# batcher task itself; both are owned by the app lifespan.
+_ai_queue: asyncio.Queue | None = None
+_ai_batcher: asyncio.Task | None = None
+# Serialized scrape response and its ETag per (URL, include_full_text), with
+# the monotonic time it expires at.
+_response_cache: OrderedDict[tuple[str, bool], tuple[bytes, str, float]] = OrderedDict()
+_response_cache_bytes = 0
+# AI analysis per prompt-content digest, with the monotonic time it expires at.
+_ai_cache: OrderedDict[bytes, tuple[tuple, float]] = OrderedDict()
+# tiktoken encoding for AI_MODEL; loaded at startup, None if that failed.
+_token_encoding: tiktoken.Encoding | None = None
+# Worker processes for the CPU-bound extraction phases; owned by the lifespan.
+_extraction_pool: ProcessPoolExecutor | None = None
+# Shared, pooled HTTP session; opened and closed by the app lifespan.
+_http_session: aiohttp.ClientSession | None = None
 
 
 class ScrapeRequest(BaseModel):
     url: HttpUrl
+    # full_text can approach 1MB; by default only the excerpt and paragraphs are sent.
+    include_full_text: bool = False
 
 
 class ScrapeResponse(BaseModel):
@@ -86,7 +195,54 @@ class ScrapeResponse(BaseModel):
     warnings: List[str]
 
 
-app = FastAPI(title=APP_NAME, version="1.0.0", description="AI-powered web scraping API with comprehensive data extraction")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open one keep-alive connection pool for the lifetime of the app."""
+    global _http_session, _resolver, _ai_queue, _ai_batcher, _extraction_pool, _token_encoding
+    # Created here so the c-ares channel binds to this lifespan's event loop.
+    _resolver = DefaultResolver()
+    # aiohttp advertises gzip/deflate (and br when Brotli is installed) and
+    # decodes the body itself, so Accept-Encoding is left to it.
+    _http_session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(
+            limit=HTTP_POOL_SIZE, resolver=_resolver, ttl_dns_cache=DNS_CACHE_TTL
+        ),
+        headers={"User-Agent": USER_AGENT},
+        timeout=FETCH_TIMEOUT,
+    )
+    _extraction_pool = _new_extraction_pool()
+    if openai_client:
+        # The BPE file may be downloaded on first use, so load it off the loop.
+        try:
+            _token_encoding = await asyncio.to_thread(tiktoken.encoding_for_model, AI_MODEL)
+        except Exception as e:
+            print(f"Warning: Could not load tokenizer, truncating AI input by characters: {e}")
+        _ai_queue = asyncio.Queue()
+        _ai_batcher = asyncio.create_task(_run_ai_batcher(_ai_queue))
+    try:
+        yield
+    finally:
+        if _ai_batcher is not None:
+            _ai_batcher.cancel()
+            await asyncio.gather(_ai_batcher, return_exceptions=True)
+            _ai_queue = _ai_batcher = None
+        await _http_session.close()
+        _http_session = None
+        # The connector does not own a resolver it was handed, so close it here.
+        await _resolver.close()
+        _resolver = None
+        _extraction_pool.shutdown(wait=False, cancel_futures=True)
+        _extraction_pool = None
+
+
+app = FastAPI(
+    title=APP_NAME,
+    version="1.0.0",
+    description="AI-powered web scraping API with comprehensive data extraction",
+    lifespan=lifespan,
+    # orjson encodes the large scrape payloads several times faster.
+    default_response_class=ORJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -99,7 +255,11 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["GET", "POST", "OPTIONS"],
     allow_headers=["*"],
+    # Lets the frontend read the ETag and send it back as If-None-Match.
+    expose_headers=["ETag"],
 )
+# Scrape responses carry the full page text and are highly compressible.
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 
 @app.get("/")
@@ -127,18 +287,56 @@ def health_check():
     }
 
 
-def _ensure_public_host(host: str) -> None:
+async def _resolve_host(hostname: str) -> str | None:
+    """Resolve a hostname to an IPv4 address, serving repeats from a TTL cache."""
+    now = time.monotonic()
+    cached = _dns_cache.get(hostname)
+    if cached is not None and cached[1] > now:
+        _dns_cache.move_to_end(hostname)
+        return cached[0]
+
+    # Outside the app lifespan a resolver is made for this lookup alone, so
+    # none outlives (or is shared across) the event loop it was bound to.
+    resolver = _resolver or DefaultResolver()
+    try:
+        addresses = await resolver.resolve(hostname, 0, family=socket.AF_INET)
+    except OSError:
+        return None
+    finally:
+        if resolver is not _resolver:
+            await resolver.close()
+    if not addresses:
+        return None
+
+    resolved_ip = addresses[0]["host"]
+    _dns_cache[hostname] = (resolved_ip, time.monotonic() + DNS_CACHE_TTL)
+    _dns_cache.move_to_end(hostname)
+    if len(_dns_cache) > DNS_CACHE_SIZE:
+        _dns_cache.popitem(last=False)
+    return resolved_ip
+
+
+async def _ensure_public_host(host: str) -> None:
     hostname = host.lower()
     if hostname in BLOCKED_HOSTS:
         raise HTTPException(status_code=400, detail="Local targets are not allowed.")
 
-    try:
-        ip = ipaddress.ip_address(hostname)
-    except ValueError:
+    # IP literals are dotted IPv4 (leading digit) or IPv6 (contains ':'), so
+    # ordinary DNS names skip the parse-and-raise round trip.
+    ip = None
+    if hostname[:1].isdigit() or ":" in hostname:
+        try:
+            ip = ipaddress.ip_address(hostname)
+        except ValueError:
+            pass
+
+    if ip is None:
+        resolved_ip = await _resolve_host(hostname)
+        if resolved_ip is None:
+            return
         try:
-            resolved_ip = socket.gethostbyname(hostname)
             ip = ipaddress.ip_address(resolved_ip)
-        except (socket.gaierror, ValueError):
+        except ValueError:
             return
 
     if ip.is_private or ip.is_loopback or ip.is_reserved or ip.is_multicast:
@@ -147,175 +345,323 @@ def _ensure_public_host(host: str) -> None:
         )
 
 
-def _is_allowed_by_robots(target_url: str) -> tuple[bool, list[str]]:
-    parsed = urlparse(target_url)
-    robots_url = urljoin(f"{parsed.scheme}://{parsed.netloc}", "/robots.txt")
+async def _fetch_robots(session: aiohttp.ClientSession, robots_url: str) -> tuple[robotparser.RobotFileParser | None, float]:
+    """Download and parse robots.txt, with how long to cache the result.
+
+    None means it could not be fetched at all.
+    """
     parser = robotparser.RobotFileParser()
     parser.set_url(robots_url)
 
-    warnings: list[str] = []
-
+    # Same status handling as RobotFileParser.read(), but over the shared
+    # async session instead of a blocking urllib call.
     try:
-        parser.read()
+        async with session.get(robots_url) as response:
+            if response.status >= 500:
+                # A server error means complete disallow (RFC 9309), but it
+                # is likely transient, so it is only cached briefly.
+                parser.disallow_all = True
+                return parser, ROBOTS_FAILURE_TTL
+            if response.status in (401, 403):
+                parser.disallow_all = True
+            elif response.status >= 400:
+                parser.allow_all = True
+            else:
+                body = await response.read()
+                parser.parse(body.decode("utf-8", errors="replace").splitlines())
     except Exception:
+        return None, ROBOTS_FAILURE_TTL
+
+    return parser, ROBOTS_CACHE_TTL
+
+
+async def _load_robots(session: aiohttp.ClientSession, origin: str) -> tuple[robotparser.RobotFileParser | None, float]:
+    """Download robots.txt for an origin and store it in the cache."""
+    parser, ttl = await _fetch_robots(session, urljoin(origin, "/robots.txt"))
+    # Failures are cached for ROBOTS_FAILURE_TTL so transient errors recover.
+    expires = time.monotonic() + ttl
+    _robots_cache[origin] = (parser, expires)
+    _robots_cache.move_to_end(origin)
+    if len(_robots_cache) > ROBOTS_CACHE_SIZE:
+        _robots_cache.popitem(last=False)
+    return parser, expires
+
+
+async def _is_allowed_by_robots(session: aiohttp.ClientSession, target_url: str) -> tuple[bool, list[str]]:
+    parsed = urlparse(target_url)
+    origin = f"{parsed.scheme}://{parsed.netloc}"
+
+    # The caches are only touched from the event loop. Lookups and stores
+    # never straddle an await, and a cache miss shares one in-flight
+    # download per origin, so concurrent first hits fetch robots.txt once.
+    now = time.monotonic()
+    decision = _robots_decisions.get(target_url)
+    if decision is not None and decision[1] > now:
+        _robots_decisions.move_to_end(target_url)
+        return decision[0], []
+
+    cached = _robots_cache.get(origin)
+    if cached is not None and cached[1] > now:
+        _robots_cache.move_to_end(origin)
+        parser, expires = cached
+    else:
+        download = _robots_downloads.get(origin)
+        if download is None:
+            download = asyncio.create_task(_load_robots(session, origin))
+            _robots_downloads[origin] = download
+            download.add_done_callback(lambda _: _robots_downloads.pop(origin, None))
+        # Shielded so one cancelled scrape does not abort the download for
+        # the others waiting on it.
+        parser, expires = await asyncio.shield(download)
+
+    warnings: list[str] = []
+
+    if parser is None:
         warnings.append("robots.txt could not be downloaded; assuming allow.")
         return True, warnings
 
+    # A decision expires with the robots.txt it came from.
     allowed = parser.can_fetch(USER_AGENT, target_url)
+    _robots_decisions[target_url] = (allowed, expires)
+    if len(_robots_decisions) > ROBOTS_DECISION_CACHE_SIZE:
+        _robots_decisions.popitem(last=False)
     return allowed, warnings
 
 
-def _extract_metadata(html: str, base_url: str) -> tuple[str | None, str | None, str, str, list[str], list[str], dict[str, list[str]], dict[str, str], dict[str, str], str | None, int, list[dict], list[dict], list[dict], list[str], list[str], list[str], list[dict], list[str], list[str], list[str], list[str], list[str]]:
-    soup = BeautifulSoup(html, "html.parser")
+def _url_resolver(base_url: str) -> Callable[[str], str]:
+    """Build a resolver for hrefs on the page at base_url.
+
+    Most hrefs are already absolute or root-relative and only need a prefix;
+    urljoin handles the rest, including any with dot segments to remove.
+    Hrefs that never lead to a page return "".
+    """
+    base = urlparse(base_url)
+    base_origin = f"{base.scheme}://{base.netloc}"
+    # Relative hrefs repeat across nav bars and footers; join each one once.
+    joined: dict[str, str] = {}
+
+    def resolve(href: str) -> str:
+        if href.startswith(SKIPPED_HREF_PREFIXES):
+            return ""
+        if "/." not in href:
+            if href.startswith(("http://", "https://")):
+                return href
+            if href.startswith("//"):
+                return f"{base.scheme}:{href}"
+            if href.startswith("/"):
+                return base_origin + href
+        absolute = joined.get(href)
+        if absolute is None:
+            absolute = joined[href] = urljoin(base_url, href)
+        return absolute
+
+    return resolve
+
+
+def _utf8_html(html: bytes, encoding: str | None) -> bytes:
+    """Return the page as UTF-8 bytes for both extraction phases.
+
+    Lexbor parses bytes as UTF-8 (ignoring <meta charset>), and a str would
+    be re-encoded by every parse, so UTF-8 pages are passed through as-is and
+    anything else is transcoded once. Tries a UTF-8 or UTF-16 BOM, the
+    declared charset, a <meta charset> near the top of the document, then
+    UTF-8 and windows-1252 before replacing bad bytes.
+    """
+    if html.startswith(codecs.BOM_UTF8):
+        return html[len(codecs.BOM_UTF8):]
+    if html.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        # The utf-16 codec reads the byte order from the BOM and drops it.
+        return html.decode("utf-16", errors="replace").encode("utf-8")
+    declared = [encoding] if encoding else []
+    match = META_CHARSET_RE.search(html, 0, 4096)
+    if match:
+        declared.append(match.group(1).decode("ascii"))
+    for candidate in [*declared, "utf-8", "cp1252"]:
+        try:
+            is_utf8 = codecs.lookup(candidate).name == "utf-8"
+            if is_utf8 and candidate in declared:
+                # Declared UTF-8 is trusted; Lexbor replaces invalid bytes.
+                return html
+            text = html.decode(candidate)
+        except (LookupError, UnicodeDecodeError):
+            continue
+        return html if is_utf8 else text.encode("utf-8")
+    return html.decode("utf-8", errors="replace").encode("utf-8")
+
+
+def _login_page_result() -> tuple[None, None, str, str, list, list, dict, dict, dict, None, int, list, list, list[str]]:
+    """_extract_metadata's result for a login page: nothing but the warning."""
+    return None, None, "", "", [], [], {}, {}, {}, None, 0, [], [], ["Login form detected; scraping aborted."]
+
+
+def _extract_metadata(markup: bytes, base_url: str) -> tuple[str | None, str | None, str, str, list[str], list[str], dict[str, list[str]], dict[str, str], dict[str, str], str | None, int, list[dict], list[dict], list[str]]:
+    """Extract everything the AI analysis needs, plus the login-page check.
+
+    Runs on Lexbor, whose selectors and text extraction are in C, so this is
+    the cheap first phase of a scrape.
+    """
+    tree = LexborHTMLParser(markup)
+
+    # scrape() rejects login pages, so check for them before doing any other
+    # extraction work; two targeted queries that stop at the first match.
+    if (
+        tree.css_first('input[type="password"]') is not None
+        or tree.css_first('form[id*="login" i]') is not None
+    ):
+        return _login_page_result()
 
     # Basic metadata
-    title = soup.title.string.strip() if soup.title and soup.title.string else None
-    description_tag = soup.find("meta", attrs={"name": "description"})
-    description = (
-        description_tag.get("content", "").strip() if description_tag else None
-    )
+    title_tag = tree.css_first("title")
+    title_text = title_tag.text() if title_tag else None
+    title = title_text.strip() if title_text else None
 
-    # Language detection
-    lang = soup.html.get("lang") if soup.html else None
-    if not lang:
-        lang_tag = soup.find("meta", attrs={"http-equiv": "Content-Language"})
-        if lang_tag:
-            lang = lang_tag.get("content", "").split(",")[0].strip()
+    # Extract meta tags and social media tags (Open Graph, Twitter Cards)
+    description = None
+    lang_tag_content = None
+    meta_tags = {}
+    og_tags = {}
+    twitter_tags = {}
+    for meta in tree.css("meta"):
+        attrs = meta.attributes
+        meta_name = attrs.get("name")
+        prop = attrs.get("property")
+        http_equiv = attrs.get("http-equiv")
+        content = attrs.get("content")
+
+        if description is None and meta_name == "description":
+            description = (content or "").strip()
+        if lang_tag_content is None and http_equiv == "Content-Language":
+            lang_tag_content = content or ""
+
+        name = meta_name or prop or http_equiv
+        if name and content:
+            meta_tags[name.lower()] = content
+
+        if prop and prop.startswith("og:"):
+            prop = prop.replace("og:", "")
+            if prop and content:
+                og_tags[f"og:{prop}"] = content
 
-    # Remove scripts and styles
-    for script in soup(["script", "style", "noscript", "iframe"]):
-        script.decompose()
+        if meta_name and meta_name.startswith("twitter:"):
+            meta_name = meta_name.replace("twitter:", "")
+            if meta_name and content:
+                twitter_tags[f"twitter:{meta_name}"] = content
+    social_tags = {**og_tags, **twitter_tags}
+
+    # Language detection
+    lang = tree.root.attrs.get("lang") if tree.root else None
+    if not lang and lang_tag_content is not None:
+        lang = lang_tag_content.split(",")[0].strip()
 
     # Extract full text
-    text = soup.get_text(separator="\n")
-    text = "\n".join(line.strip() for line in text.splitlines() if line.strip())
+    for node in tree.css(", ".join(NON_TEXT_TAGS)):
+        node.decompose()
+    text = tree.root.text(separator="\n") if tree.root else ""
+    text = "\n".join([stripped for line in text.splitlines() if (stripped := line.strip())])
+    if "login" in text[:500].lower():
+        return _login_page_result()
     word_count = len(text.split())
     excerpt = text[:1200] + ("…" if len(text) > 1200 else "")
 
-    # Extract links
-    links = []
-    seen_links = set()
-    for link in soup.find_all("a", href=True):
-        absolute = urljoin(base_url, link["href"])
-        if absolute not in seen_links and absolute.startswith(("http://", "https://")):
-            links.append(absolute)
-            seen_links.add(absolute)
-            if len(links) == 100:  # Increased limit
-                break
-
-    # Extract images
-    images = []
-    seen_images = set()
-    for img in soup.find_all("img", src=True):
-        absolute = urljoin(base_url, img["src"])
-        if absolute not in seen_images and absolute.startswith(("http://", "https://")):
-            images.append(absolute)
-            seen_images.add(absolute)
-            if len(images) == 50:
-                break
-
-    # Extract headings
-    headings = {
-        "h1": [],
-        "h2": [],
-        "h3": [],
-        "h4": [],
-        "h5": [],
-        "h6": [],
-    }
-    for level in headings.keys():
-        for heading in soup.find_all(level):
-            text_content = heading.get_text(strip=True)
-            if text_content:
-                headings[level].append(text_content)
-
-    # Extract meta tags
-    meta_tags = {}
-    for meta in soup.find_all("meta"):
-        name = meta.get("name") or meta.get("property") or meta.get("http-equiv")
-        content = meta.get("content")
-        if name and content:
-            meta_tags[name.lower()] = content
+    resolve = _url_resolver(base_url)
+
+    # Extract links and images from one traversal, in document order. The
+    # loop ends early once both caps are reached. Insertion-ordered dicts
+    # dedupe with one hash per URL instead of a set lookup plus add.
+    links: dict[str, None] = {}
+    images: dict[str, None] = {}
+    # node.attrs looks up a single attribute in C; node.attributes would
+    # build a dict of every attribute on each iteration.
+    for node in tree.css("a[href], img[src]"):
+        if node.tag == "a":
+            if len(links) < 100:  # Increased limit
+                absolute = resolve(node.attrs.get("href") or "")
+                if absolute.startswith(("http://", "https://")):
+                    links[absolute] = None
+        elif len(images) < 50:
+            absolute = resolve(node.attrs.get("src") or "")
+            if absolute.startswith(("http://", "https://")):
+                images[absolute] = None
+        if len(links) == 100 and len(images) == 50:
+            break
 
-    # Extract social media tags (Open Graph, Twitter Cards)
-    social_tags = {}
-    og_tags = soup.find_all("meta", property=lambda x: x and x.startswith("og:"))
-    for tag in og_tags:
-        prop = tag.get("property", "").replace("og:", "")
-        content = tag.get("content", "")
-        if prop and content:
-            social_tags[f"og:{prop}"] = content
-
-    twitter_tags = soup.find_all("meta", attrs={"name": lambda x: x and x.startswith("twitter:")})
-    for tag in twitter_tags:
-        name = tag.get("name", "").replace("twitter:", "")
-        content = tag.get("content", "")
-        if name and content:
-            social_tags[f"twitter:{name}"] = content
+    # Extract headings, all levels in one query
+    headings = {level: [] for level in HEADING_LEVELS}
+    for heading in tree.css(HEADING_SELECTOR):
+        text_content = heading.text(strip=True)
+        if text_content:
+            headings[heading.tag].append(text_content)
 
     # Extract tables
     tables = []
-    for table in soup.find_all("table"):
+    for table in tree.css("table"):
         table_data = {"headers": [], "rows": []}
-        headers = table.find_all("th")
+        headers = table.css("th")
         if headers:
-            table_data["headers"] = [th.get_text(strip=True) for th in headers]
-        for row in table.find_all("tr"):
-            cells = row.find_all(["td", "th"])
+            table_data["headers"] = [th.text(strip=True) for th in headers]
+        for row in table.css("tr"):
+            cells = row.css("td, th")
             if cells:
-                table_data["rows"].append([cell.get_text(strip=True) for cell in cells])
+                table_data["rows"].append([cell.text(strip=True) for cell in cells])
         if table_data["rows"] or table_data["headers"]:
             tables.append(table_data)
             if len(tables) >= 20:  # Limit to 20 tables
                 break
 
     # Extract forms
+    label_for = {}
+    for label in tree.css("label[for]"):
+        label_for.setdefault(label.attrs.get("for"), label)
     forms = []
-    for form in soup.find_all("form"):
+    for form in tree.css("form"):
+        form_attrs = form.attributes
         form_data = {
-            "action": form.get("action", ""),
-            "method": form.get("method", "get").upper(),
+            "action": form_attrs.get("action") or "",
+            "method": (form_attrs.get("method") or "get").upper(),
             "inputs": []
         }
-        for input_tag in form.find_all(["input", "textarea", "select"]):
+        for input_tag in form.css("input, textarea, select"):
+            input_attrs = input_tag.attributes
             input_data = {
-                "type": input_tag.get("type", input_tag.name),
-                "name": input_tag.get("name", ""),
-                "placeholder": input_tag.get("placeholder", ""),
+                "type": input_attrs.get("type") or input_tag.tag,
+                "name": input_attrs.get("name") or "",
+                "placeholder": input_attrs.get("placeholder") or "",
                 "label": ""
             }
             # Try to find associated label
-            if input_tag.get("id"):
-                label = soup.find("label", {"for": input_tag.get("id")})
+            if input_attrs.get("id"):
+                label = label_for.get(input_attrs.get("id"))
                 if label:
-                    input_data["label"] = label.get_text(strip=True)
+                    input_data["label"] = label.text(strip=True)
             form_data["inputs"].append(input_data)
         if form_data["inputs"]:
             forms.append(form_data)
             if len(forms) >= 10:  # Limit to 10 forms
                 break
 
-    # Extract buttons
-    buttons = []
-    for button in soup.find_all(["button", "input"]):
-        if button.get("type") in ["button", "submit", "reset"] or button.name == "button":
-            button_data = {
-                "text": button.get_text(strip=True) or button.get("value", ""),
-                "type": button.get("type", "button"),
-                "class": button.get("class", [])
-            }
-            buttons.append(button_data)
-            if len(buttons) >= 50:
-                break
+    return title, description, excerpt, text, list(links), list(images), headings, meta_tags, social_tags, lang, word_count, tables, forms, []
+
+
+def _extract_content(markup: bytes, base_url: str) -> tuple[list[dict], list[str], list[str], list[str], list[dict], list[str], list[str], list[str]]:
+    """Extract the remaining page content.
+
+    Nothing here feeds the AI prompt, so scrape() runs this phase while the
+    OpenAI request is in flight.
+    """
+    tree = LexborHTMLParser(markup)
+    resolve = _url_resolver(base_url)
+
+    # Markup inside noscript/style is never reported. script and iframe only
+    # hold raw text, so they are read for their src first and dropped after.
+    for node in tree.css("noscript, style"):
+        node.decompose()
 
     # Extract videos
     videos = []
-    for video in soup.find_all(["video", "iframe"]):
-        src = video.get("src") or video.get("data-src")
-        if not src and video.name == "iframe":
-            src = video.get("src")
+    for video in tree.css("video, iframe"):
+        src = video.attrs.get("src") or video.attrs.get("data-src")
         if src:
-            absolute = urljoin(base_url, src)
+            absolute = resolve(src)
             if absolute.startswith(("http://", "https://")):
                 videos.append(absolute)
                 if len(videos) >= 20:
@@ -323,46 +669,67 @@ def _extract_metadata(html: str, base_url: str) -> tuple[str | None, str | None,
 
     # Extract scripts
     scripts = []
-    for script in soup.find_all("script", src=True):
-        src = script.get("src")
-        if src:
-            absolute = urljoin(base_url, src)
-            if absolute.startswith(("http://", "https://")):
-                scripts.append(absolute)
-                if len(scripts) >= 30:
-                    break
+    for script in tree.css("script[src]"):
+        absolute = resolve(script.attrs.get("src") or "")
+        if absolute.startswith(("http://", "https://")):
+            scripts.append(absolute)
+            if len(scripts) >= 30:
+                break
+
+    for node in tree.css("script, iframe"):
+        node.decompose()
+
+    # Extract buttons
+    buttons = []
+    for button in tree.css("button, input"):
+        attrs = button.attributes
+        button_type = attrs.get("type")
+        if button_type in ["button", "submit", "reset"] or button.tag == "button":
+            button_data = {
+                "text": button.text(strip=True) or attrs.get("value") or "",
+                "type": button_type if button_type is not None else "button",
+                "class": (attrs.get("class") or "").split()
+            }
+            buttons.append(button_data)
+            if len(buttons) >= 50:
+                break
 
     # Extract stylesheets
     stylesheets = []
-    for link in soup.find_all("link", rel="stylesheet"):
-        href = link.get("href")
-        if href:
-            absolute = urljoin(base_url, href)
-            if absolute.startswith(("http://", "https://")):
-                stylesheets.append(absolute)
-                if len(stylesheets) >= 20:
-                    break
+    for link in tree.css("link[href]"):
+        if "stylesheet" not in (link.attrs.get("rel") or "").split():
+            continue
+        absolute = resolve(link.attrs.get("href") or "")
+        if absolute.startswith(("http://", "https://")):
+            stylesheets.append(absolute)
+            if len(stylesheets) >= 20:
+                break
 
     # Extract lists
     lists_data = []
-    for list_tag in soup.find_all(["ul", "ol"]):
-        items = [li.get_text(strip=True) for li in list_tag.find_all("li")]
+    for list_tag in tree.css("ul, ol"):
+        items = [li.text(strip=True) for li in list_tag.css("li")]
         if items:
             lists_data.append({
-                "type": list_tag.name,
+                "type": list_tag.tag,
                 "items": items[:50]  # Limit items per list
             })
             if len(lists_data) >= 30:
                 break
 
     # Extract paragraphs
-    paragraphs = [p.get_text(strip=True) for p in soup.find_all("p") if p.get_text(strip=True)]
-    paragraphs = paragraphs[:100]  # Limit to 100 paragraphs
+    paragraphs = []
+    for paragraph in tree.css("p"):
+        paragraph_text = paragraph.text(strip=True)
+        if paragraph_text:
+            paragraphs.append(paragraph_text)
+            if len(paragraphs) >= 100:  # Limit to 100 paragraphs
+                break
 
     # Extract quotes
     quotes = []
-    for quote in soup.find_all(["blockquote", "q", "cite"]):
-        quote_text = quote.get_text(strip=True)
+    for quote in tree.css("blockquote, q, cite"):
+        quote_text = quote.text(strip=True)
         if quote_text:
             quotes.append(quote_text)
             if len(quotes) >= 30:
@@ -370,293 +737,475 @@ def _extract_metadata(html: str, base_url: str) -> tuple[str | None, str | None,
 
     # Extract code blocks
     code_blocks = []
-    for code in soup.find_all(["code", "pre"]):
-        code_text = code.get_text(strip=True)
+    for code in tree.css("code, pre"):
+        code_text = code.text(strip=True)
         if code_text and len(code_text) > 10:  # Only meaningful code blocks
             code_blocks.append(code_text[:500])  # Limit length
             if len(code_blocks) >= 20:
                 break
 
-    # Check for login forms
-    warnings = []
-    if soup.find("input", {"type": "password"}) or soup.find("form", {"id": lambda x: x and "login" in x.lower()}) or "login" in text.lower()[:500]:
-        warnings.append("Login form detected; scraping aborted.")
+    return buttons, videos, scripts, stylesheets, lists_data, paragraphs, quotes, code_blocks
 
-    return title, description, excerpt, text, links, images, headings, meta_tags, social_tags, lang, word_count, tables, forms, buttons, videos, scripts, stylesheets, lists_data, paragraphs, quotes, code_blocks, warnings
 
+def _json_text(value) -> str | None:
+    """A non-empty string from the AI JSON, else None."""
+    if isinstance(value, str):
+        return value.strip() or None
+    return None
 
-def _get_ai_analysis(text: str, title: str | None, tables: list, forms: list, links: list) -> tuple[str | None, list[str] | None, str | None, str | None, list[dict] | None, list[str] | None, list[str] | None, dict | None, str | None]:
-    """Use OpenAI to comprehensively analyze and extract structured data from scraped content."""
-    if not openai_client:
-        print("OpenAI client not available, skipping AI analysis")
+
+def _json_strings(value) -> list[str] | None:
+    """A non-empty list of strings from the AI JSON, else None."""
+    if isinstance(value, str):  # e.g. keywords sent as "a, b, c"
+        value = value.split(",")
+    if not isinstance(value, list):
+        return None
+    return [str(item).strip() for item in value if str(item).strip()] or None
+
+
+def _analysis_from_json(result) -> tuple[str | None, list[str] | None, str | None, str | None, list[dict] | None, list[str] | None, list[str] | None, dict | None, str | None]:
+    """Map one page's JSON analysis onto the response fields, dropping ill-typed values."""
+    if not isinstance(result, dict):
         return None, None, None, None, None, None, None, None, None
+    entities = result.get("entities")
+    if isinstance(entities, list):
+        entities = [entity for entity in entities if isinstance(entity, dict)] or None
+    else:
+        entities = None
+    structured_data = result.get("structured_data")
+    if not isinstance(structured_data, dict) or not structured_data:
+        structured_data = None
+    return (
+        _json_text(result.get("summary")),
+        _json_strings(result.get("key_points")),
+        _json_text(result.get("category")),
+        _json_text(result.get("sentiment")),
+        entities,
+        _json_strings(result.get("topics")),
+        _json_strings(result.get("keywords")),
+        structured_data,
+        _json_text(result.get("insights")),
+    )
 
-    try:
-        # Prepare context for AI
-        text_for_analysis = text[:12000] if len(text) > 12000 else text
-        if not text_for_analysis or len(text_for_analysis.strip()) < 10:
-            print("Warning: Text content too short for AI analysis")
-            return None, None, None, None, None, None, None, None, None
-            
-        tables_info = f"Found {len(tables)} tables" if tables else "No tables found"
-        forms_info = f"Found {len(forms)} forms" if forms else "No forms found"
-        links_count = len(links)
-        
-        prompt = f"""Analyze the following webpage content comprehensively and provide detailed insights:
 
-Title: {title or 'Not provided'}
-Content: {text_for_analysis}
-Additional Info: {tables_info}, {forms_info}, {links_count} links found
+def _ai_document(index: int, fields: dict) -> str:
+    """Format one page for a batch prompt.
+
+    Pages from unrelated requests share a prompt, so [DOC markers in the
+    page's own title or text are defused before they can read as a boundary.
+    """
+    title = DOC_MARKER_RE.sub(r"(\1", fields["title"])
+    text = DOC_MARKER_RE.sub(r"(\1", fields["text"])
+    return AI_DOCUMENT_TEMPLATE.format(id=index, **dict(fields, title=title, text=text))
+
+
+async def _analyze_pages(pages: list[dict]) -> list[tuple]:
+    """Analyze a batch of pages with one OpenAI call; one result tuple per page."""
+    empty = (None, None, None, None, None, None, None, None, None)
+    try:
+        documents = "\n\n".join(_ai_document(index, fields) for index, fields in enumerate(pages, 1))
+        prompt = AI_PROMPT_TEMPLATE.format(count=len(pages), documents=documents)
 
-Please provide:
-1. SUMMARY: A comprehensive 3-4 sentence summary
-2. KEY_POINTS: 5-7 main topics or key points (one per line, prefixed with "-")
-3. CATEGORY: Primary content type (e.g., "News Article", "Product Page", "Blog Post", "Documentation", "E-commerce", "Landing Page", etc.)
-4. SENTIMENT: Overall sentiment (Positive, Negative, Neutral, or Mixed)
-5. ENTITIES: Extract important entities (people, organizations, locations, products) as JSON array: [{{"name": "...", "type": "PERSON|ORG|LOCATION|PRODUCT"}}]
-6. TOPICS: List 5-7 main topics discussed (one per line, prefixed with "-")
-7. KEYWORDS: Extract 10-15 important keywords (comma-separated)
-8. STRUCTURED_DATA: Extract structured information as JSON object with keys like: purpose, target_audience, main_offer, contact_info, pricing_info, features (if applicable)
-9. INSIGHTS: Provide 2-3 actionable insights about the content
-
-Format your response exactly as:
-SUMMARY: [summary text]
-KEY_POINTS:
-- [point 1]
-- [point 2]
-CATEGORY: [category]
-SENTIMENT: [sentiment]
-ENTITIES: [JSON array]
-TOPICS:
-- [topic 1]
-- [topic 2]
-KEYWORDS: [comma-separated keywords]
-STRUCTURED_DATA: [JSON object]
-INSIGHTS: [insights text]"""
-
-        print("Calling OpenAI API for content analysis...")
-        response = openai_client.chat.completions.create(
-            model="gpt-3.5-turbo",
+        print(f"Calling OpenAI API for content analysis of {len(pages)} page(s)...")
+        response = await openai_client.chat.completions.create(
+            model=AI_MODEL,
             messages=[
-                {"role": "system", "content": "You are an expert web content analyst that extracts comprehensive structured data and insights from web pages. Always provide valid JSON when requested."},
+                AI_SYSTEM_MESSAGE,
                 {"role": "user", "content": prompt}
             ],
-            max_tokens=2000,
-            temperature=0.7,
-            timeout=30.0,  # 30 second timeout
+            response_format={"type": "json_object"},
+            max_tokens=AI_MAX_TOKENS_PER_PAGE * len(pages),
+            temperature=0,
+            timeout=AI_TIMEOUT + AI_TIMEOUT_PER_EXTRA_PAGE * (len(pages) - 1),
         )
 
         if not response or not response.choices or len(response.choices) == 0:
             print("Error: Empty response from OpenAI API")
-            return None, None, None, None, None, None, None, None, None
+            return [empty] * len(pages)
 
         content = response.choices[0].message.content
-        
+
         if not content:
             print("Error: No content in OpenAI response")
-            return None, None, None, None, None, None, None, None, None
-        
+            return [empty] * len(pages)
+
         print(f"OpenAI API response received ({len(content)} characters)")
-        
-        # Parse the comprehensive response
-        summary = None
-        key_points = []
-        category = None
-        sentiment = None
-        entities = None
-        topics = []
-        keywords = []
-        structured_data = None
-        insights = None
 
-        if "SUMMARY:" in content:
-            summary = content.split("SUMMARY:")[1].split("KEY_POINTS:")[0].strip()
-        
-        if "KEY_POINTS:" in content:
-            key_points_section = content.split("KEY_POINTS:")[1].split("CATEGORY:")[0] if "CATEGORY:" in content else content.split("KEY_POINTS:")[1]
-            key_points = [point.strip().lstrip("- ").strip() for point in key_points_section.strip().split("\n") if point.strip() and point.strip().startswith("-")]
-        
-        if "CATEGORY:" in content:
-            category_section = content.split("CATEGORY:")[1]
-            category = category_section.split("SENTIMENT:")[0].strip() if "SENTIMENT:" in category_section else category_section.split("\n")[0].strip()
-        
-        if "SENTIMENT:" in content:
-            sentiment_section = content.split("SENTIMENT:")[1]
-            sentiment = sentiment_section.split("ENTITIES:")[0].strip() if "ENTITIES:" in sentiment_section else sentiment_section.split("\n")[0].strip()
-        
-        if "ENTITIES:" in content:
-            entities_section = content.split("ENTITIES:")[1].split("TOPICS:")[0] if "TOPICS:" in content else content.split("ENTITIES:")[1]
-            try:
-                import json
-                # Try to extract JSON from the section
-                entities_text = entities_section.strip()
-                # Remove any markdown code blocks if present
-                if entities_text.startswith("```"):
-                    entities_text = entities_text.split("```")[1]
-                    if entities_text.startswith("json"):
-                        entities_text = entities_text[4:]
-                entities_text = entities_text.strip()
-                entities = json.loads(entities_text)
-                print(f"Extracted {len(entities) if isinstance(entities, list) else 0} entities")
-            except json.JSONDecodeError as e:
-                print(f"Warning: Could not parse entities JSON: {e}")
-                entities = None
-        
-        if "TOPICS:" in content:
-            topics_section = content.split("TOPICS:")[1].split("KEYWORDS:")[0] if "KEYWORDS:" in content else content.split("TOPICS:")[1]
-            topics = [topic.strip().lstrip("- ").strip() for topic in topics_section.strip().split("\n") if topic.strip() and topic.strip().startswith("-")]
-        
-        if "KEYWORDS:" in content:
-            keywords_section = content.split("KEYWORDS:")[1].split("STRUCTURED_DATA:")[0] if "STRUCTURED_DATA:" in content else content.split("KEYWORDS:")[1]
-            keywords = [kw.strip() for kw in keywords_section.strip().split(",") if kw.strip()]
-        
-        if "STRUCTURED_DATA:" in content:
-            structured_section = content.split("STRUCTURED_DATA:")[1].split("INSIGHTS:")[0] if "INSIGHTS:" in content else content.split("STRUCTURED_DATA:")[1]
-            try:
-                import json
-                # Try to extract JSON from the section
-                structured_text = structured_section.strip()
-                # Remove any markdown code blocks if present
-                if structured_text.startswith("```"):
-                    structured_text = structured_text.split("```")[1]
-                    if structured_text.startswith("json"):
-                        structured_text = structured_text[4:]
-                structured_text = structured_text.strip()
-                structured_data = json.loads(structured_text)
-                print("Successfully extracted structured data")
-            except json.JSONDecodeError as e:
-                print(f"Warning: Could not parse structured_data JSON: {e}")
-                structured_data = None
-        
-        if "INSIGHTS:" in content:
-            insights = content.split("INSIGHTS:")[1].strip()
+        if response.choices[0].finish_reason == "length":
+            # The JSON was cut off, so no page in the batch has a result. One
+            # verbose page should not cost the others theirs: retry in halves.
+            print(f"Warning: OpenAI response truncated at max_tokens for {len(pages)} page(s)")
+            if len(pages) == 1:
+                return [empty]
+            middle = len(pages) // 2
+            return await _analyze_pages(pages[:middle]) + await _analyze_pages(pages[middle:])
+
+        results = orjson.loads(content).get("results")
+        if not isinstance(results, list):
+            print("Error: OpenAI response has no results list")
+            return [empty] * len(pages)
+        by_id = {}
+        for result in results:
+            if isinstance(result, dict):
+                # The model sometimes echoes ids as strings ("1") or floats.
+                try:
+                    by_id[int(str(result.get("id")).split(".")[0])] = result
+                except ValueError:
+                    pass
+        if len(results) == len(pages) and any(index not in by_id for index in range(1, len(pages) + 1)):
+            # Ids missing or off (e.g. counted from 0), but one result per
+            # page: trust the order instead.
+            by_id = dict(enumerate(results, 1))
 
         print("AI analysis completed successfully")
-        return summary, key_points if key_points else None, category, sentiment, entities, topics if topics else None, keywords if keywords else None, structured_data, insights
+        return [_analysis_from_json(by_id.get(index)) for index in range(1, len(pages) + 1)]
 
     except Exception as e:
         import traceback
         print(f"AI analysis failed: {e}")
         print(f"Traceback: {traceback.format_exc()}")
+        return [empty] * len(pages)
+
+
+async def _resolve_ai_batch(batch: list[tuple[dict, asyncio.Future]]) -> None:
+    """Run one batched OpenAI call and hand each page its result."""
+    try:
+        results = await _analyze_pages([fields for fields, _ in batch])
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+    finally:
+        # Never leave a scrape waiting, e.g. when cancelled at shutdown.
+        for _, future in batch:
+            future.cancel()
+
+
+async def _run_ai_batcher(queue: asyncio.Queue) -> None:
+    """Group queued pages into OpenAI calls of up to AI_BATCH_MAX pages.
+
+    A batch opens with the first queued page and stays open for
+    AI_BATCH_WAIT, unless it is already full. Calls run as their own tasks so
+    the next batch can form while one is in flight, up to
+    AI_MAX_CONCURRENT_CALLS at a time.
+    """
+    in_flight: set[asyncio.Task] = set()
+    slots = asyncio.Semaphore(AI_MAX_CONCURRENT_CALLS)
+    try:
+        while True:
+            # Take a call slot before opening a batch: while every slot is
+            # busy, pages keep queueing and the next batch goes out fuller.
+            await slots.acquire()
+            batch = [await queue.get()]
+            if queue.qsize() < AI_BATCH_MAX - 1:
+                await asyncio.sleep(AI_BATCH_WAIT)
+            while len(batch) < AI_BATCH_MAX and not queue.empty():
+                batch.append(queue.get_nowait())
+            # Pages whose scrape already failed are dropped before the call.
+            batch = [item for item in batch if not item[1].done()]
+            if not batch:
+                slots.release()
+                continue
+            task = asyncio.create_task(_resolve_ai_batch(batch))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+            task.add_done_callback(lambda _: slots.release())
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+
+def _truncate_for_ai(text: str) -> str:
+    """Trim page text to AI_MAX_INPUT_TOKENS tokens for the prompt."""
+    if _token_encoding is None:
+        return text[:AI_MAX_INPUT_CHARS]
+    # Only a prefix can survive the cut, so never tokenize the whole page;
+    # tokens average well under 8 characters.
+    tokens = _token_encoding.encode_ordinary(text[:AI_MAX_INPUT_TOKENS * 8])
+    if len(tokens) <= AI_MAX_INPUT_TOKENS:
+        return text[:AI_MAX_INPUT_TOKENS * 8]
+    return _token_encoding.decode(tokens[:AI_MAX_INPUT_TOKENS])
+
+
+async def _get_ai_analysis(text: str, title: str | None, tables: list, forms: list, links: list) -> tuple[str | None, list[str] | None, str | None, str | None, list[dict] | None, list[str] | None, list[str] | None, dict | None, str | None]:
+    """Use OpenAI to comprehensively analyze and extract structured data from scraped content.
+
+    Concurrent scrapes are micro-batched into shared OpenAI calls.
+    """
+    if not openai_client:
+        print("OpenAI client not available, skipping AI analysis")
         return None, None, None, None, None, None, None, None, None
 
+    # Prepare context for AI
+    text_for_analysis = _truncate_for_ai(text)
+    # Bounded split: stops counting once the threshold is reached.
+    if len(text_for_analysis.split(None, AI_MIN_WORDS)) < AI_MIN_WORDS:
+        print("Warning: Text content too short for AI analysis")
+        return None, None, None, None, None, None, None, None, None
+    sample = text_for_analysis[:AI_SAMPLE_CHARS]
+    printable = sum(c.isprintable() or c.isspace() for c in sample)
+    if printable / len(sample) < AI_MIN_PRINTABLE_RATIO:
+        print("Warning: Text content looks like binary or markup; skipping AI analysis")
+        return None, None, None, None, None, None, None, None, None
+
+    fields = {
+        "title": title or "Not provided",
+        "text": text_for_analysis,
+        "tables_info": f"Found {len(tables)} tables" if tables else "No tables found",
+        "forms_info": f"Found {len(forms)} forms" if forms else "No forms found",
+        "links_count": len(links),
+    }
 
-def _fetch_html(target_url: str) -> tuple[str, list[str]]:
+    # Identical prompt content (a re-scraped or mirrored page) is answered
+    # from memory instead of another OpenAI round trip.
+    digest = hashlib.blake2b(
+        "\0".join(str(value) for value in fields.values()).encode("utf-8"), digest_size=16
+    ).digest()
+    cached = _ai_cache.get(digest)
+    if cached is not None and cached[1] > time.monotonic():
+        _ai_cache.move_to_end(digest)
+        print("AI analysis served from cache")
+        return cached[0]
+
+    if _ai_queue is None:
+        # No batcher outside the app lifespan; analyze this page on its own.
+        result = (await _analyze_pages([fields]))[0]
+    else:
+        future = asyncio.get_running_loop().create_future()
+        _ai_queue.put_nowait((fields, future))
+        result = await future
+
+    # Failed analyses (all None) are not cached so the next scrape retries.
+    if any(value is not None for value in result):
+        _ai_cache[digest] = (result, time.monotonic() + AI_CACHE_TTL)
+        _ai_cache.move_to_end(digest)
+        if len(_ai_cache) > AI_CACHE_SIZE:
+            _ai_cache.popitem(last=False)
+    return result
+
+
+async def _fetch_html(session: aiohttp.ClientSession, target_url: str) -> tuple[bytes, str | None, list[str]]:
     """Fetch HTML content from the target URL with proper error handling."""
     try:
         print(f"Fetching URL: {target_url}")
-        response = requests.get(
+        async with session.get(
             target_url,
             headers={
-                "User-Agent": USER_AGENT,
                 "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
                 "Accept-Language": "en-US,en;q=0.5",
-                "Accept-Encoding": "gzip, deflate",
-                "Connection": "keep-alive",
             },
-            timeout=(10, 30),  # Increased timeout
             allow_redirects=True,
-            stream=True,  # Stream to check size before downloading
-        )
-        response.raise_for_status()  # Raise exception for bad status codes
-        
-        print(f"Response status: {response.status_code}")
-        print(f"Content-Type: {response.headers.get('content-type', 'unknown')}")
-        
-    except requests.exceptions.Timeout:
+        ) as response:
+            response.raise_for_status()  # Raise exception for bad status codes
+
+            print(f"Response status: {response.status}")
+            print(f"Content-Type: {response.headers.get('content-type', 'unknown')}")
+
+            content_type = response.headers.get("content-type", "").lower()
+            # Two plain substring tests; no generator per response.
+            if "text/html" not in content_type and "application/xhtml+xml" not in content_type:
+                raise HTTPException(
+                    status_code=415,
+                    detail=f"Unsupported content type: {content_type}. Only HTML content is supported."
+                )
+
+            # Reject up front when the server announces an oversize body
+            content_length = response.content_length
+            if content_length is not None and content_length > MAX_DOWNLOAD_BYTES:
+                response.close()
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Page is too large ({content_length} bytes). Maximum size is {MAX_DOWNLOAD_BYTES} bytes."
+                )
+
+            if content_length is not None and response.headers.get("content-encoding", "identity") == "identity":
+                # Known, uncompressed length under the cap: one read, no loop.
+                # (For compressed bodies Content-Length is the wire size, so the
+                # decoded size still has to be checked while streaming.)
+                content = await response.read()
+            else:
+                # Read content with size check; a bytearray grows in place
+                # instead of copying the whole body on every chunk.
+                buffer = bytearray()
+                async for chunk in response.content.iter_chunked(65536):
+                    buffer += chunk
+                    if len(buffer) > MAX_DOWNLOAD_BYTES:
+                        # Drop the connection rather than drain the rest of the body
+                        response.close()
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"Page is too large. Maximum size is {MAX_DOWNLOAD_BYTES} bytes."
+                        )
+                content = bytes(buffer)
+
+            # Only the charset the server declared; None leaves detection to
+            # _utf8_html (BOM, <meta charset>, then UTF-8/windows-1252).
+            encoding = response.charset
+
+    except asyncio.TimeoutError:
         raise HTTPException(status_code=504, detail="Request timeout: The server took too long to respond.")
-    except requests.exceptions.ConnectionError:
+    except aiohttp.ClientConnectionError:
         raise HTTPException(status_code=502, detail="Connection error: Could not connect to the server.")
-    except requests.exceptions.HTTPError as e:
-        raise HTTPException(status_code=e.response.status_code if e.response else 502, detail=f"HTTP error: {e}")
-    except requests.RequestException as exc:
+    except aiohttp.ClientResponseError as e:
+        raise HTTPException(status_code=e.status, detail=f"HTTP error: {e}")
+    except aiohttp.ClientError as exc:
         raise HTTPException(status_code=502, detail=f"Request failed: {str(exc)}") from exc
 
-    content_type = response.headers.get("content-type", "").lower()
-    if not any(ct in content_type for ct in SCRAPABLE_CONTENT_TYPES):
-        raise HTTPException(
-            status_code=415, 
-            detail=f"Unsupported content type: {content_type}. Only HTML content is supported."
-        )
+    print(f"Successfully fetched {len(content)} bytes")
+    return content, encoding, [f"Content-Type: {content_type}"]
+
+
+async def _fetch_allowed_html(session: aiohttp.ClientSession, target_url: str) -> tuple[bytes, str | None, list[str]]:
+    """Download a page once robots.txt allows it, with the warnings of both steps."""
+    # robots.txt must allow the page before it is requested at all. A cached
+    # decision or parser answers without I/O, so only the first scrape of an
+    # origin per ROBOTS_CACHE_TTL waits on the download.
+    allowed, robot_warnings = await _is_allowed_by_robots(session, target_url)
+    if not allowed:
+        raise HTTPException(status_code=403, detail="robots.txt forbids scraping.")
+    print(f"robots.txt check passed. Warnings: {robot_warnings}")
+
+    print("Fetching HTML content...")
+    html, encoding, response_warnings = await _fetch_html(session, target_url)
+    return html, encoding, robot_warnings + response_warnings
+
+
+def _new_extraction_pool() -> ProcessPoolExecutor:
+    # spawn, not fork: the server already runs threads (uvicorn, to_thread,
+    # DNS) that a forked child could inherit mid-lock.
+    return ProcessPoolExecutor(max_workers=EXTRACTION_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+
+async def _run_extraction(func: Callable, markup: bytes, base_url: str):
+    """Run a CPU-bound extraction phase in the process pool.
+
+    Parsing holds the GIL, so worker processes let concurrent scrapes parse
+    on separate cores while the event loop keeps serving I/O. Small pages,
+    where pickling and the round trip cost more than the parse, and calls
+    outside the app lifespan run in a thread instead.
+    """
+    global _extraction_pool
+    pool = _extraction_pool
+    if pool is None or len(markup) < EXTRACTION_POOL_MIN_BYTES:
+        return await asyncio.to_thread(func, markup, base_url)
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(pool, func, markup, base_url)
+    except BrokenProcessPool:
+        # A worker died (OOM kill, segfault) and the executor refuses all
+        # further work. Replace it once for every caller that saw it break,
+        # then retry; a second failure parses in a thread instead.
+        print("Extraction pool broken; starting a new one.")
+        if _extraction_pool is pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+            _extraction_pool = _new_extraction_pool()
+        try:
+            return await loop.run_in_executor(_extraction_pool, func, markup, base_url)
+        except BrokenProcessPool:
+            return await asyncio.to_thread(func, markup, base_url)
 
-    # Check content length
-    content_length = response.headers.get("content-length")
-    if content_length and int(content_length) > MAX_DOWNLOAD_BYTES:
-        raise HTTPException(
-            status_code=413, 
-            detail=f"Page is too large ({content_length} bytes). Maximum size is {MAX_DOWNLOAD_BYTES} bytes."
-        )
 
-    # Read content with size check
-    content = b""
-    for chunk in response.iter_content(chunk_size=8192):
-        content += chunk
-        if len(content) > MAX_DOWNLOAD_BYTES:
-            raise HTTPException(
-                status_code=413,
-                detail=f"Page is too large. Maximum size is {MAX_DOWNLOAD_BYTES} bytes."
-            )
-    
-    print(f"Successfully fetched {len(content)} bytes")
-    return content.decode("utf-8", errors="ignore"), [f"Content-Type: {content_type}"]
+def _cache_response(key: tuple[str, bool], body: bytes, etag: str, ttl: float) -> None:
+    """Store a serialized response, evicting the oldest past RESPONSE_CACHE_MAX_BYTES."""
+    global _response_cache_bytes
+    previous = _response_cache.pop(key, None)
+    if previous is not None:
+        _response_cache_bytes -= len(previous[0])
+    if len(body) > RESPONSE_CACHE_MAX_BYTES:
+        return
+    _response_cache[key] = (body, etag, time.monotonic() + ttl)
+    _response_cache_bytes += len(body)
+    while _response_cache_bytes > RESPONSE_CACHE_MAX_BYTES:
+        _, (evicted, _, _) = _response_cache.popitem(last=False)
+        _response_cache_bytes -= len(evicted)
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Whether an If-None-Match header covers the given (strong) ETag."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def _json_response(body: bytes, etag: str, if_none_match: str | None) -> Response:
+    """Serve a serialized scrape, or 304 when the client already has it."""
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(body, media_type="application/json", headers={"ETag": etag})
 
 
 @app.post("/api/scrape", response_model=ScrapeResponse)
-def scrape(request: ScrapeRequest) -> ScrapeResponse:
+async def scrape(request: ScrapeRequest, if_none_match: str | None = Header(default=None)) -> Response:
     """Main scraping endpoint that fetches and analyzes web content."""
     try:
         print(f"\n{'='*60}")
         print(f"Scraping request received for: {request.url}")
         print(f"{'='*60}\n")
-        
+
+        # A URL scraped in the last RESPONSE_CACHE_TTL is served as-is; it
+        # already passed the host and robots.txt checks.
+        cache_key = (str(request.url), request.include_full_text)
+        cached = _response_cache.get(cache_key)
+        if cached is not None and cached[2] > time.monotonic():
+            _response_cache.move_to_end(cache_key)
+            print("Serving cached scrape response")
+            return _json_response(cached[0], cached[1], if_none_match)
+
         parsed = urlparse(str(request.url))
         if parsed.scheme not in {"http", "https"}:
             raise HTTPException(status_code=400, detail="Only HTTP/S URLs are supported.")
 
-        _ensure_public_host(parsed.hostname or "")
+        await _ensure_public_host(parsed.hostname or "")
         print(f"Host validation passed: {parsed.hostname}")
 
-        allowed, robot_warnings = _is_allowed_by_robots(str(request.url))
-        if not allowed:
-            raise HTTPException(status_code=403, detail="robots.txt forbids scraping.")
-        print(f"robots.txt check passed. Warnings: {robot_warnings}")
-
-        print("Fetching HTML content...")
-        html, response_warnings = _fetch_html(str(request.url))
-        print(f"HTML fetched successfully ({len(html)} characters)")
+        if _http_session is not None:
+            html, encoding, warnings = await _fetch_allowed_html(_http_session, str(request.url))
+        else:
+            # Outside the app lifespan there is no shared pool, so fall back
+            # to a session for this request alone.
+            async with aiohttp.ClientSession(headers={"User-Agent": USER_AGENT}, timeout=FETCH_TIMEOUT) as session:
+                html, encoding, warnings = await _fetch_allowed_html(session, str(request.url))
+        print(f"HTML fetched successfully ({len(html)} bytes, encoding: {encoding or 'auto'})")
 
         print("Extracting metadata...")
-        title, description, excerpt, full_text, links, images, headings, meta_tags, social_tags, lang, word_count, tables, forms, buttons, videos, scripts, stylesheets, lists_data, paragraphs, quotes, code_blocks, login_warnings = _extract_metadata(
-            html, str(request.url)
+        markup = await asyncio.to_thread(_utf8_html, html, encoding)
+        title, description, excerpt, full_text, links, images, headings, meta_tags, social_tags, lang, word_count, tables, forms, login_warnings = await _run_extraction(
+            _extract_metadata, markup, str(request.url)
         )
         print(f"Metadata extracted: {len(links)} links, {len(images)} images, {word_count} words")
 
         if login_warnings:
             raise HTTPException(status_code=400, detail=login_warnings[0])
 
-        # Get comprehensive AI analysis using OpenAI
+        # Get comprehensive AI analysis using OpenAI. The request is started
+        # first so the rest of the extraction runs while it is in flight.
         print("Starting AI analysis with OpenAI...")
-        ai_summary, ai_key_points, ai_category, ai_sentiment, ai_entities, ai_topics, ai_keywords, ai_structured_data, ai_insights = _get_ai_analysis(
-            full_text, title, tables, forms, links
-        )
+        ai_task = asyncio.create_task(_get_ai_analysis(full_text, title, tables, forms, links))
+        try:
+            buttons, videos, scripts, stylesheets, lists_data, paragraphs, quotes, code_blocks = await _run_extraction(
+                _extract_content, markup, str(request.url)
+            )
+        except BaseException:
+            ai_task.cancel()
+            raise
+        ai_result = await ai_task
+        ai_summary, ai_key_points, ai_category, ai_sentiment, ai_entities, ai_topics, ai_keywords, ai_structured_data, ai_insights = ai_result
         
         if ai_summary:
             print("AI analysis completed successfully")
         else:
             print("AI analysis skipped or failed (non-critical)")
 
-        warnings = robot_warnings + response_warnings
-
         print(f"\n{'='*60}")
         print("Scraping completed successfully!")
         print(f"{'='*60}\n")
 
-        return ScrapeResponse(
+        response = ScrapeResponse(
             fetched_url=request.url,
             title=title,
             description=description,
             text_excerpt=excerpt,
-            full_text=full_text,
+            full_text=full_text if request.include_full_text else "",
             links=links,
             images=images,
             headings=headings,
@@ -685,6 +1234,16 @@ def scrape(request: ScrapeRequest) -> ScrapeResponse:
             ai_insights=ai_insights,
             warnings=warnings,
         )
+
+        # Serialize once: the bytes are both the cached copy and the body,
+        # and their digest is the ETag.
+        body = orjson.dumps(response.model_dump(mode="json"))
+        etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        # An empty analysis may be a transient OpenAI failure, so it is only
+        # reused briefly rather than pinned for the full TTL.
+        ai_failed = openai_client is not None and all(value is None for value in ai_result)
+        _cache_response(cache_key, body, etag, RESPONSE_CACHE_FAILURE_TTL if ai_failed else RESPONSE_CACHE_TTL)
+        return _json_response(body, etag, if_none_match)
     except HTTPException:
         # Re-raise HTTP exceptions as-is
         raise
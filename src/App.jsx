@@ -40,7 +40,7 @@ function App() {
       const response = await fetch(API_URL, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ url: targetUrl.trim() }),
+        body: JSON.stringify({ url: targetUrl.trim(), include_full_text: true }),
       })
 
       const payload = await response.json().catch(() => ({}))